@@ -11,6 +11,8 @@ s3 = boto3.client("s3")
 TABLES = ["ChimpBuddy_AgentRegistry", "ChimpBridge_AgentRegistry", "ChimpBuddy_Negotiations"]
 FAISS_BUCKET = "chimpbridge-faiss-indexes"
 FAISS_KEY = "agent_vectors.index"
+SHARD_PREFIX = "shards/"
+ARCHIVE_BUCKET = "chimpbuddy-negotiation-archive"
 
 def clear_table(table_name):
     try:
@@ -39,15 +41,41 @@ def clear_table(table_name):
 
 def clear_faiss():
     try:
-        s3.delete_object(Bucket=FAISS_BUCKET, Key=FAISS_KEY)
-        return {"faiss": "deleted"}
-    except s3.exceptions.NoSuchKey:
-        return {"faiss": "empty"}
+        keys = [FAISS_KEY]
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=FAISS_BUCKET, Prefix=SHARD_PREFIX):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        
+        if len(keys) == 1:
+            s3.delete_object(Bucket=FAISS_BUCKET, Key=FAISS_KEY)
+            return {"faiss": "empty"}
+        
+        for start in range(0, len(keys), 1000):
+            s3.delete_objects(
+                Bucket=FAISS_BUCKET,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]]}
+            )
+        return {"faiss": "deleted", "shards_deleted": len(keys) - 1}
     except s3.exceptions.NoSuchBucket:
         return {"faiss": "bucket_not_exists"}
     except Exception as e:
         return {"faiss": "error", "error": str(e)}
 
+def clear_archive():
+    try:
+        deleted = 0
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=ARCHIVE_BUCKET):
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if objects:
+                s3.delete_objects(Bucket=ARCHIVE_BUCKET, Delete={"Objects": objects})
+                deleted += len(objects)
+        return {"archive": "deleted" if deleted else "empty", "count": deleted}
+    except s3.exceptions.NoSuchBucket:
+        return {"archive": "bucket_not_exists"}
+    except Exception as e:
+        return {"archive": "error", "error": str(e)}
+
 def lambda_handler(event, context):
     logger.info("🔄 ChimpBridge Demo Reset Started")
     
@@ -55,7 +83,8 @@ def lambda_handler(event, context):
         "status": "success", 
         "message": "ChimpBridge AI Agent Marketplace Reset Complete", 
         "tables": [], 
-        "faiss": {}
+        "faiss": {},
+        "archive": {}
     }
     
     # Clear DynamoDB tables
@@ -65,6 +94,9 @@ def lambda_handler(event, context):
     # Clear FAISS index
     results["faiss"] = clear_faiss()
     
+    # Clear archived negotiations
+    results["archive"] = clear_archive()
+    
     logger.info(f"Reset results: {results}")
     
     return {
@@ -1,11 +1,19 @@
 import json
+import re
+import heapq
+import hashlib
+import uuid
+import time
+import random
 import boto3
 import numpy as np
 import faiss
 import logging
+from collections import OrderedDict
 from datetime import datetime
 from botocore.exceptions import ClientError
 from decimal import Decimal
+from chimp_bedrock import set_deadline, invoke_model_cached, BedrockError, BedrockResponseError, BedrockThrottledError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -13,52 +21,378 @@ logger.setLevel(logging.INFO)
 BRIDGE_TABLE_NAME = "ChimpBridge_AgentRegistry"
 FAISS_BUCKET = "chimpbridge-faiss-indexes"
 FAISS_KEY = "agent_vectors.index"
+SHARD_PREFIX = "shards/"
+SHARD_MAX_SIZE = 5000
+MANIFEST_MAX_ATTEMPTS = 5
+MANIFEST_CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+BATCH_GET_BACKOFF_BASE = 0.05
+BATCH_GET_BACKOFF_CAP = 2
+SHARD_CACHE_MAX_VECTORS = 20000
+EMBEDDING_DIMENSION = 1536
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+DEFAULT_CATEGORY = "general"
+
+# Keyword -> category routing for agents that don't declare an explicit Category.
+CATEGORY_KEYWORDS = {
+    "tickets": ["ticket", "seat", "section", "game", "concert", "event", "admission"],
+    "catering": ["catering", "food", "meal", "chef", "restaurant", "menu"],
+    "travel": ["travel", "flight", "hotel", "accommodation", "rental", "trip"],
+    "services": ["consulting", "repair", "cleaning", "tutoring", "design", "development"],
+}
 
 dynamodb = boto3.resource("dynamodb")
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
 s3 = boto3.client("s3")
 bridge_table = dynamodb.Table(BRIDGE_TABLE_NAME)
 
+# Shard versions are immutable, so loaded (index, agent_ids) pairs stay valid across warm invocations
+shard_cache = OrderedDict()
+
 def get_text_embedding(text):
+    result = invoke_model_cached(EMBEDDING_MODEL_ID, {"inputText": text})
     try:
-        response = bedrock.invoke_model(
-            modelId="amazon.titan-embed-text-v1",
-            body=json.dumps({"inputText": text}),
-            contentType="application/json",
-            accept="application/json"
-        )
-        result = json.loads(response["body"].read())
         return np.array(result["embedding"], dtype=np.float32)
-    except Exception as e:
-        logger.error(f"Embedding error: {str(e)}")
-        return None
+    except (KeyError, TypeError) as e:
+        raise BedrockResponseError("Embedding response missing vector", EMBEDDING_MODEL_ID) from e
+
+def normalize_category(category):
+    slug = re.sub(r'[^a-z0-9]+', '-', str(category).lower()).strip('-')
+    return slug or DEFAULT_CATEGORY
+
+def classify_text(text):
+    text = text.lower()
+    scores = {
+        category: sum(text.count(keyword) for keyword in keywords)
+        for category, keywords in CATEGORY_KEYWORDS.items()
+    }
+    best = max(scores, key=scores.get)
+    return best if scores[best] > 0 else DEFAULT_CATEGORY
+
+def derive_category(profile):
+    if profile.get("Category"):
+        return normalize_category(profile["Category"])
+    services = profile.get("Services", [])
+    if isinstance(services, str):
+        services = [services]
+    category = classify_text(" ".join(services))
+    if category == DEFAULT_CATEGORY:
+        category = classify_text(profile.get("Description", ""))
+    return category
 
-def load_faiss_index():
+def agent_hash_bits(agent_id):
+    digest = hashlib.sha1(agent_id.encode("utf-8")).digest()
+    return "".join(f"{byte:08b}" for byte in digest)
+
+def shard_keys(shard, version):
+    return f"{SHARD_PREFIX}{shard}/{version}.index", f"{SHARD_PREFIX}{shard}/{version}.ids.json"
+
+def manifest_key(category):
+    return f"{SHARD_PREFIX}{category}/manifest.json"
+
+def load_manifest(category):
+    """Return a category's shard manifest and its ETag (None if it doesn't exist yet)."""
     try:
-        response = s3.get_object(Bucket=FAISS_BUCKET, Key=FAISS_KEY)
-        index_data = response['Body'].read()
+        response = s3.get_object(Bucket=FAISS_BUCKET, Key=manifest_key(category))
+        return json.loads(response['Body'].read()), response['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] != "NoSuchKey":
+            raise
+        # Shards are keyed by the hash-bit prefix each one owns; a new category starts with one root shard
+        return {"Shards": {"": {"Size": 0}}}, None
+
+def save_manifest(category, manifest, etag):
+    """Write the manifest only if it is unchanged since it was read; False on conflict."""
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3.put_object(Bucket=FAISS_BUCKET, Key=manifest_key(category), Body=json.dumps(manifest), **condition)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in MANIFEST_CONFLICT_CODES:
+            return False
+        raise
+
+def list_categories():
+    categories = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=FAISS_BUCKET, Prefix=SHARD_PREFIX, Delimiter="/"):
+        categories.extend(common["Prefix"][len(SHARD_PREFIX):].rstrip("/") for common in page.get("CommonPrefixes", []))
+    return categories
+
+def load_manifests(categories):
+    return {category: load_manifest(category)[0] for category in categories}
+
+def route_shard(manifest, category, agent_id):
+    # Shard prefixes within a category form a prefix-free set, so exactly one matches.
+    bits = agent_hash_bits(agent_id)
+    for prefix in manifest["Shards"]:
+        if bits.startswith(prefix):
+            return prefix
+    raise ValueError(f"No shard covers agent {agent_id} in category {category}")
+
+def shard_id(category, prefix):
+    return f"{category}/{prefix or 'root'}"
+
+def cache_shard(shard, version, index, agent_ids):
+    shard_cache[(shard, version)] = (index, agent_ids)
+    shard_cache.move_to_end((shard, version))
+    while len(shard_cache) > 1 and sum(cached.ntotal for cached, _ in shard_cache.values()) > SHARD_CACHE_MAX_VECTORS:
+        shard_cache.popitem(last=False)
+
+def load_shard(shard, version):
+    """Load a shard version, from the warm-container cache when possible.
+    
+    Cached objects are shared, so callers that modify a shard must use load_shard_copy.
+    """
+    if not version:
+        return faiss.IndexFlatIP(EMBEDDING_DIMENSION), []
+    if (shard, version) in shard_cache:
+        shard_cache.move_to_end((shard, version))
+        return shard_cache[(shard, version)]
+    
+    index_key, ids_key = shard_keys(shard, version)
+    response = s3.get_object(Bucket=FAISS_BUCKET, Key=index_key)
+    index_data = response['Body'].read()
+    
+    with open('/tmp/temp_index.faiss', 'wb') as f:
+        f.write(index_data)
+    
+    index = faiss.read_index('/tmp/temp_index.faiss')
+    response = s3.get_object(Bucket=FAISS_BUCKET, Key=ids_key)
+    agent_ids = json.loads(response['Body'].read())
+    cache_shard(shard, version, index, agent_ids)
+    return index, agent_ids
+
+def load_shard_copy(shard, version):
+    index, agent_ids = load_shard(shard, version)
+    return faiss.clone_index(index), list(agent_ids)
+
+def save_shard(shard, index, agent_ids):
+    """Write a new immutable version of a shard; it becomes live once the manifest points at it."""
+    version = uuid.uuid4().hex
+    index_key, ids_key = shard_keys(shard, version)
+    faiss.write_index(index, '/tmp/temp_index.faiss')
+    
+    with open('/tmp/temp_index.faiss', 'rb') as f:
+        s3.put_object(Bucket=FAISS_BUCKET, Key=index_key, Body=f.read())
+    s3.put_object(Bucket=FAISS_BUCKET, Key=ids_key, Body=json.dumps(agent_ids))
+    cache_shard(shard, version, index, agent_ids)
+    return version
+
+def delete_shard_versions(versions):
+    for shard, version in versions:
+        if not version:
+            continue
+        shard_cache.pop((shard, version), None)
+        for key in shard_keys(shard, version):
+            s3.delete_object(Bucket=FAISS_BUCKET, Key=key)
+
+def remove_agent(index, agent_ids, agent_id):
+    if agent_id not in agent_ids:
+        return False
+    position = agent_ids.index(agent_id)
+    index.remove_ids(np.array([position], dtype=np.int64))
+    agent_ids.pop(position)
+    return True
+
+def split_shard(manifest, category, prefix, index, agent_ids, changes):
+    """Split an oversized shard in two on the next bit of the agent hash."""
+    vectors = index.reconstruct_n(0, index.ntotal)
+    shards = manifest["Shards"]
+    
+    for bit in "01":
+        child = prefix + bit
+        child_index = faiss.IndexFlatIP(EMBEDDING_DIMENSION)
+        child_ids = []
+        for position, agent_id in enumerate(agent_ids):
+            if agent_hash_bits(agent_id)[len(prefix)] == bit:
+                child_index.add(vectors[position].reshape(1, -1))
+                child_ids.append(agent_id)
+        version = save_shard(shard_id(category, child), child_index, child_ids)
+        changes["written"].append((shard_id(category, child), version))
+        shards[child] = {"Size": child_index.ntotal, "Version": version}
+    
+    # The parent's objects are only deleted once the manifest no longer references them
+    changes["superseded"].append((shard_id(category, prefix), shards.pop(prefix).get("Version")))
+    logger.info(f"Split shard {shard_id(category, prefix)} ({index.ntotal} agents)")
+
+def replace_shard(manifest, category, prefix, index, agent_ids, changes):
+    shard = shard_id(category, prefix)
+    entry = manifest["Shards"][prefix]
+    version = save_shard(shard, index, agent_ids)
+    changes["written"].append((shard, version))
+    changes["superseded"].append((shard, entry.get("Version")))
+    entry.update({"Size": index.ntotal, "Version": version})
+
+def unregister_from_shard(manifest, category, agent_id, changes):
+    prefix = route_shard(manifest, category, agent_id)
+    index, agent_ids = load_shard_copy(shard_id(category, prefix), manifest["Shards"][prefix].get("Version"))
+    if remove_agent(index, agent_ids, agent_id):
+        replace_shard(manifest, category, prefix, index, agent_ids, changes)
+
+def register_in_shard(manifest, category, agent_id, embedding, changes):
+    prefix = route_shard(manifest, category, agent_id)
+    shard = shard_id(category, prefix)
+    index, agent_ids = load_shard_copy(shard, manifest["Shards"][prefix].get("Version"))
+    
+    # Re-registration replaces the agent's previous vector
+    remove_agent(index, agent_ids, agent_id)
+    index.add(embedding.reshape(1, -1))
+    agent_ids.append(agent_id)
+    
+    if index.ntotal > SHARD_MAX_SIZE:
+        split_shard(manifest, category, prefix, index, agent_ids, changes)
+    else:
+        replace_shard(manifest, category, prefix, index, agent_ids, changes)
+    
+    return shard, index.ntotal
+
+def commit_category_change(category, apply):
+    """Apply a change to one category's shards and commit it with a conditional manifest write.
+    
+    Each category has its own manifest, so only writers to the same category
+    contend. Shard versions are immutable, so a writer that loses the race only
+    leaves unreferenced objects behind; it cleans them up and retries on fresh state.
+    """
+    for attempt in range(MANIFEST_MAX_ATTEMPTS):
+        manifest, etag = load_manifest(category)
+        changes = {"written": [], "superseded": []}
+        result = apply(manifest, changes)
         
-        with open('/tmp/temp_index.faiss', 'wb') as f:
-            f.write(index_data)
+        if not changes["written"] or save_manifest(category, manifest, etag):
+            delete_shard_versions(changes["superseded"])
+            return manifest, result
         
-        return faiss.read_index('/tmp/temp_index.faiss')
-    except Exception as e:
-        logger.info(f"Creating new FAISS index: {str(e)}")
-        return faiss.IndexFlatIP(1536)
+        logger.info(f"Shard manifest conflict for {category} on attempt {attempt + 1}, retrying")
+        delete_shard_versions(changes["written"])
+    
+    raise RuntimeError(f"Shard manifest for {category} kept changing, retry the registration")
 
-def save_faiss_index(index):
-    try:
-        faiss.write_index(index, '/tmp/temp_index.faiss')
+def update_shards(previous_categories, category, agent_id, embedding):
+    """Move an agent's vector into its category's shards.
+    
+    ShardCategories on the registry item is a superset of the categories whose
+    shards may hold the agent: the new category is recorded before its shard
+    is written and an old one is forgotten only after its removal commits, so
+    a registration that fails part-way is cleaned up by the next one.
+    """
+    bridge_table.update_item(
+        Key={"AgentID": agent_id},
+        UpdateExpression="ADD ShardCategories :category",
+        ExpressionAttributeValues={":category": {category}}
+    )
+    
+    # Add to the new category before removing from the old ones so the agent stays searchable
+    manifest, (shard, shard_size) = commit_category_change(
+        category, lambda manifest, changes: register_in_shard(manifest, category, agent_id, embedding, changes)
+    )
+    for previous_category in set(previous_categories) - {category}:
+        commit_category_change(
+            previous_category,
+            lambda manifest, changes: unregister_from_shard(manifest, previous_category, agent_id, changes)
+        )
+        bridge_table.update_item(
+            Key={"AgentID": agent_id},
+            UpdateExpression="DELETE ShardCategories :category",
+            ExpressionAttributeValues={":category": {previous_category}}
+        )
+    return manifest, shard, shard_size
+
+def build_category_shards(category, entries, prefix=""):
+    """Write shards for a category's (AgentID, vector) entries, splitting until each fits."""
+    if len(entries) > SHARD_MAX_SIZE:
+        shards = {}
+        for bit in "01":
+            child_entries = [entry for entry in entries if agent_hash_bits(entry[0])[len(prefix)] == bit]
+            shards.update(build_category_shards(category, child_entries, prefix + bit))
+        return shards
+    
+    index = faiss.IndexFlatIP(EMBEDDING_DIMENSION)
+    for _, embedding in entries:
+        index.add(embedding.reshape(1, -1))
+    version = save_shard(shard_id(category, prefix), index, [agent_id for agent_id, _ in entries])
+    return {prefix: {"Size": index.ntotal, "Version": version}}
+
+def scan_registry():
+    scan_kwargs = {}
+    while True:
+        response = bridge_table.scan(**scan_kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        scan_kwargs["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+def rebuild_shards(context=None):
+    """Rebuild every shard from ChimpBridge_AgentRegistry.
+    
+    Agents registered against the old single agent_vectors.index have no shard
+    entry. Their vectors can't be recovered by position, so each description is
+    re-embedded.
+    """
+    entries = {}
+    for agent in scan_registry():
+        category = agent.get("Category") or derive_category(agent.get("Profile", {}))
+        if agent.get("Category") != category or agent.get("ShardCategories") != {category}:
+            bridge_table.update_item(
+                Key={"AgentID": agent["AgentID"]},
+                UpdateExpression="SET Category = :category, ShardCategories = :categories",
+                ExpressionAttributeValues={":category": category, ":categories": {category}}
+            )
+        # Each embedding gets its own model time budget; the rebuild is bounded by the Lambda timeout
+        set_deadline(context)
+        embedding = get_text_embedding(agent.get("Description", ""))
+        entries.setdefault(category, []).append((agent["AgentID"], embedding))
+    
+    manifests = {}
+    for category in sorted(set(list_categories()) | set(entries)):
+        manifest, etag = load_manifest(category)
+        category_entries = entries.get(category, [])
+        rebuilt = {"Shards": build_category_shards(category, category_entries) if category_entries else {"": {"Size": 0}}}
         
-        with open('/tmp/temp_index.faiss', 'rb') as f:
-            s3.put_object(Bucket=FAISS_BUCKET, Key=FAISS_KEY, Body=f.read())
+        if not save_manifest(category, rebuilt, etag):
+            delete_shard_versions((shard_id(category, prefix), entry.get("Version")) for prefix, entry in rebuilt["Shards"].items())
+            raise RuntimeError(f"Shard manifest for {category} changed during rebuild, run the rebuild again")
         
-        return True
-    except Exception as e:
-        logger.error(f"Save index error: {str(e)}")
-        return False
+        delete_shard_versions((shard_id(category, prefix), entry.get("Version")) for prefix, entry in manifest["Shards"].items())
+        manifests[category] = rebuilt
+    
+    s3.delete_object(Bucket=FAISS_BUCKET, Key=FAISS_KEY)
+    return manifests
+
+def search_shards(manifests, query_embedding, k):
+    """Search every shard of the given category manifests and merge hits by score."""
+    hits = []
+    for category, manifest in manifests.items():
+        for prefix, entry in manifest["Shards"].items():
+            index, agent_ids = load_shard(shard_id(category, prefix), entry.get("Version"))
+            if index.ntotal == 0:
+                continue
+            distances, indices = index.search(query_embedding.reshape(1, -1), min(k, index.ntotal))
+            for distance, idx in zip(distances[0], indices[0]):
+                if 0 <= idx < len(agent_ids):
+                    hits.append((float(distance), agent_ids[idx], category))
+    return heapq.nlargest(k, hits)
+
+def get_agents(agent_ids):
+    agents = {}
+    agent_ids = list(dict.fromkeys(agent_ids))
+    for start in range(0, len(agent_ids), 100):
+        request = {BRIDGE_TABLE_NAME: {"Keys": [{"AgentID": agent_id} for agent_id in agent_ids[start:start + 100]]}}
+        attempt = 0
+        while request:
+            if attempt:
+                # Keys come back unprocessed when the table is throttled; back off before retrying them
+                time.sleep(random.uniform(0, min(BATCH_GET_BACKOFF_CAP, BATCH_GET_BACKOFF_BASE * (2 ** attempt))))
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for agent in response.get('Responses', {}).get(BRIDGE_TABLE_NAME, []):
+                agents[agent['AgentID']] = agent
+            request = response.get('UnprocessedKeys') or {}
+            attempt += 1
+    return agents
+
+def marketplace_size(manifests):
+    return sum(shard["Size"] for manifest in manifests.values() for shard in manifest["Shards"].values())
 
 def lambda_handler(event, context):
+    set_deadline(context)
     try:
         body = json.loads(event.get("body", "{}"))
         action = body.get("action", "register")
@@ -73,32 +407,37 @@ def lambda_handler(event, context):
             description = profile.get("Description", "")
             embedding = get_text_embedding(description)
             
-            if embedding is None:
-                return respond(500, "Failed to generate embedding")
+            category = normalize_category(body["Category"]) if body.get("Category") else derive_category(profile)
+            previous = bridge_table.get_item(Key={"AgentID": client_id}).get('Item') or {}
+            previous_categories = previous.get("ShardCategories") or ({previous["Category"]} if previous.get("Category") else set())
+            
+            # Update only the FAISS shard this agent routes to
+            manifest, shard, shard_size = update_shards(previous_categories, category, client_id, embedding)
             
+            # The registry item is written last so its Category always names a committed shard
             agent_data = {
                 "AgentID": client_id,
                 "Profile": profile,
                 "Description": description,
                 "Services": profile.get("Services", []),
                 "Pricing": profile.get("Pricing", {}),
+                "Category": category,
+                "ShardCategories": {category},
                 "RegisteredAt": datetime.utcnow().isoformat(),
                 "Status": "active"
             }
             
             bridge_table.put_item(Item=agent_data)
             
-            # Update FAISS index
-            index = load_faiss_index()
-            index.add(embedding.reshape(1, -1))
-            save_faiss_index(index)
-            
             return respond(200, {
                 "AgentID": client_id,
                 "Status": "Registered in marketplace",
-                "IndexSize": index.ntotal
+                "Category": category,
+                "Shard": shard,
+                "ShardSize": shard_size,
+                "CategorySize": marketplace_size({category: manifest})
             })
-            
+        
         elif action == "find_matches":
             client_id = body.get("ClientID")
             description = body.get("description", "")
@@ -107,41 +446,43 @@ def lambda_handler(event, context):
             if not client_id or not description:
                 return respond(400, "Missing ClientID or description")
             
-            query_embedding = get_text_embedding(description)
-            if query_embedding is None:
-                return respond(500, "Failed to generate query embedding")
+            categories = body.get("categories") or [body.get("category") or classify_text(description)]
+            if isinstance(categories, str):
+                categories = [categories]
+            categories = [normalize_category(category) for category in categories]
             
-            index = load_faiss_index()
-            if index.ntotal == 0:
-                return respond(200, {"Matches": [], "Message": "No agents in marketplace"})
+            query_embedding = get_text_embedding(description)
             
-            # Search for similar agents
-            distances, indices = index.search(query_embedding.reshape(1, -1), min(max_results + 5, index.ntotal))
+            # An unclassified query could belong anywhere, so search the whole marketplace
+            if categories == [DEFAULT_CATEGORY]:
+                categories = list_categories()
+            manifests = load_manifests(categories)
+            if marketplace_size(manifests) == 0:
+                return respond(200, {"Matches": [], "Categories": categories, "Message": "No agents in marketplace"})
             
-            # Get all registered agents
-            response = bridge_table.scan()
-            all_agents = response.get('Items', [])
+            # Search for similar agents in the targeted shards only
+            hits = search_shards(manifests, query_embedding, max_results + 5)
+            agents = get_agents([agent_id for _, agent_id, _ in hits])
             
             matches = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx < len(all_agents):
-                    agent = all_agents[idx]
-                    
-                    # Skip self-matches
-                    if agent.get('AgentID') == client_id:
-                        continue
-                    
-                    similarity = float(distance)
-                    if similarity > 0.3:  # Minimum similarity threshold
-                        match_data = {
-                            "AgentID": agent.get('AgentID'),
-                            "Description": agent.get('Description'),
-                            "Services": agent.get('Services', []),
-                            "Pricing": agent.get('Pricing', {}),
-                            "Similarity": similarity,
-                            "Endpoint": f"https://xxxxxxxxxx.execute-api.us-east-1.amazonaws.com/default/ChimpBuddy_Broker?ClientID={agent.get('AgentID')}"
-                        }
-                        matches.append(match_data)
+            for similarity, agent_id, category in hits:
+                agent = agents.get(agent_id)
+                
+                # Skip self-matches and agents removed from, or not yet fully written to, the registry
+                if not agent or "Profile" not in agent or agent_id == client_id:
+                    continue
+                
+                if similarity > 0.3:  # Minimum similarity threshold
+                    match_data = {
+                        "AgentID": agent_id,
+                        "Description": agent.get('Description'),
+                        "Services": agent.get('Services', []),
+                        "Pricing": agent.get('Pricing', {}),
+                        "Category": category,
+                        "Similarity": similarity,
+                        "Endpoint": f"https://xxxxxxxxxx.execute-api.us-east-1.amazonaws.com/default/ChimpBuddy_Broker?ClientID={agent_id}"
+                    }
+                    matches.append(match_data)
                 
                 if len(matches) >= max_results:
                     break
@@ -149,12 +490,29 @@ def lambda_handler(event, context):
             return respond(200, {
                 "ClientID": client_id,
                 "Matches": matches,
-                "TotalAgents": index.ntotal
+                "Categories": categories,
+                "TotalAgents": marketplace_size(manifests)
             })
-            
+        
+        elif action == "rebuild":
+            manifests = rebuild_shards(context)
+            return respond(200, {
+                "Status": "Marketplace shards rebuilt",
+                "Categories": {
+                    category: len(manifest["Shards"]) for category, manifest in manifests.items()
+                },
+                "IndexSize": marketplace_size(manifests)
+            })
+        
         else:
             return respond(400, f"Unknown action: {action}")
-            
+    
+    except BedrockThrottledError as e:
+        logger.warning(f"Bedrock throttled: {str(e)}")
+        return respond(429, f"Model capacity exceeded, retry later: {str(e)}")
+    except BedrockError as e:
+        logger.error(f"Bedrock error: {str(e)}")
+        return respond(502, f"Model invocation failed: {str(e)}")
     except Exception as e:
         logger.error(f"Handler error: {str(e)}")
         return respond(500, f"Internal server error: {str(e)}")
@@ -1,20 +1,21 @@
 import json
 import boto3
 import uuid
-import os
 import logging
 from datetime import datetime
 from botocore.exceptions import ClientError
 from decimal import Decimal
+from chimp_bedrock import set_deadline, invoke_claude, extract_json, BedrockError, BedrockResponseError, BedrockThrottledError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 AGENT_TABLE_NAME = "ChimpBuddy_AgentRegistry"
 NEGOTIATION_TABLE_NAME = "ChimpBuddy_Negotiations"
+NEGOTIATION_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+NEGOTIATION_RESPONSE_FIELDS = ["response", "action", "price_per_ticket", "reasoning"]
 
 dynamodb = boto3.resource("dynamodb")
-bedrock = boto3.client("bedrock-runtime", region_name=os.environ.get("AWS_REGION", "us-east-1"))
 agent_table = dynamodb.Table(AGENT_TABLE_NAME)
 negotiation_table = dynamodb.Table(NEGOTIATION_TABLE_NAME)
 
@@ -45,9 +46,8 @@ def save_negotiation_state(negotiation_data):
         logger.error(f"Error saving negotiation: {str(e)}")
 
 def generate_smart_opening(buyer_profile, seller_profile, agent_role):
-    try:
-        if agent_role == "seller":
-            prompt = f"""You are an AI buyer agent analyzing a seller's profile to craft the perfect opening negotiation message.
+    if agent_role == "seller":
+        prompt = f"""You are an AI buyer agent analyzing a seller's profile to craft the perfect opening negotiation message.
 
 BUYER PROFILE (You):
 - Description: {buyer_profile.get('description', '')}
@@ -66,49 +66,31 @@ Craft an intelligent opening message that:
 - Sets up for productive negotiation
 
 Return ONLY the opening message text (no JSON, no quotes):"""
-        else:
-            prompt = f"""Generate a seller opening message based on buyer interest.
+    else:
+        prompt = f"""Generate a seller opening message based on buyer interest.
 Buyer: {buyer_profile.get('description', '')}
 Your offering: {seller_profile.get('description', '')}
 
 Return ONLY the opening message text:"""
 
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-            body=json.dumps({
-                "messages": [{"role": "user", "content": prompt}],
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 300,
-                "temperature": 0.8
-            }),
-            contentType="application/json",
-            accept="application/json"
-        )
-        
-        result = json.loads(response["body"].read())
-        opening_message = result["content"][0]["text"].strip()
-        logger.info(f"AI generated opening: {opening_message}")
-        return opening_message
-        
-    except Exception as e:
-        logger.error(f"Error generating smart opening: {str(e)}")
-        return "I'm interested in your tickets and would like to discuss pricing."
+    opening_message = invoke_claude(NEGOTIATION_MODEL_ID, prompt, max_tokens=300, temperature=0.8)
+    logger.info(f"AI generated opening: {opening_message}")
+    return opening_message
 
 def negotiate_with_claude(agent_profile, negotiation_history, incoming_message, agent_role):
-    try:
-        agent_name = agent_profile['Profile'].get('Name', agent_profile['ClientID'])
-        agent_description = agent_profile['Profile'].get('Description', '')
-        pricing = agent_profile['Profile'].get('Pricing', {})
-        
-        history_context = ""
-        if negotiation_history and 'Messages' in negotiation_history:
-            history_context = "\n".join([
-                f"{msg['Role']}: {msg['Content']}" 
-                for msg in negotiation_history['Messages'][-5:]
-            ])
+    agent_name = agent_profile['Profile'].get('Name', agent_profile['ClientID'])
+    agent_description = agent_profile['Profile'].get('Description', '')
+    pricing = agent_profile['Profile'].get('Pricing', {})
+    
+    history_context = ""
+    if negotiation_history and 'Messages' in negotiation_history:
+        history_context = "\n".join([
+            f"{msg['Role']}: {msg['Content']}" 
+            for msg in negotiation_history['Messages'][-5:]
+        ])
 
-        if agent_role == "seller":
-            prompt = f"""You are {agent_name}, an AI agent selling tickets. Here's your profile:
+    if agent_role == "seller":
+        prompt = f"""You are {agent_name}, an AI agent selling tickets. Here's your profile:
 
 Description: {agent_description}
 Your Pricing: {pricing}
@@ -133,8 +115,8 @@ Respond with ONLY a JSON object:
   "price_per_ticket": 275,
   "reasoning": "Why you made this decision"
 }}"""
-        else:
-            prompt = f"""You are {agent_name}, an AI agent buying tickets. Here's your profile:
+    else:
+        prompt = f"""You are {agent_name}, an AI agent buying tickets. Here's your profile:
 
 Description: {agent_description}
 Your Budget: {pricing}
@@ -160,46 +142,18 @@ Respond with ONLY a JSON object:
   "reasoning": "Why you made this decision"
 }}"""
 
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-            body=json.dumps({
-                "messages": [{"role": "user", "content": prompt}],
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 500,
-                "temperature": 0.7
-            }),
-            contentType="application/json",
-            accept="application/json"
-        )
-        
-        result = json.loads(response["body"].read())
-        ai_response = result["content"][0]["text"].strip()
-        
-        import re
-        json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-        if json_match:
-            negotiation_response = json.loads(json_match.group())
-            logger.info(f"Claude negotiation response: {negotiation_response}")
-            return negotiation_response
-        else:
-            logger.warning(f"Could not extract JSON from Claude response: {ai_response}")
-            return {
-                "response": "I'm interested in discussing this further.",
-                "action": "counter",
-                "price_per_ticket": 250,
-                "reasoning": "Fallback response"
-            }
-            
-    except Exception as e:
-        logger.error(f"Error in Claude negotiation: {str(e)}")
-        return {
-            "response": "I'm having trouble processing your request right now.",
-            "action": "counter", 
-            "price_per_ticket": 250,
-            "reasoning": f"Error: {str(e)}"
-        }
+    ai_response = invoke_claude(NEGOTIATION_MODEL_ID, prompt, max_tokens=500, temperature=0.7)
+    negotiation_response = extract_json(ai_response, NEGOTIATION_MODEL_ID)
+    
+    missing = [field for field in NEGOTIATION_RESPONSE_FIELDS if field not in negotiation_response]
+    if missing or negotiation_response["action"] not in ["counter", "accept", "reject"]:
+        raise BedrockResponseError(f"Invalid negotiation response: {negotiation_response}", NEGOTIATION_MODEL_ID)
+    
+    logger.info(f"Claude negotiation response: {negotiation_response}")
+    return negotiation_response
 
 def lambda_handler(event, context):
+    set_deadline(context)
     try:
         query_params = event.get('queryStringParameters', {}) or {}
         client_id = query_params.get('ClientID')
@@ -270,6 +224,9 @@ def lambda_handler(event, context):
             if not negotiation_history:
                 return respond(404, "Negotiation not found")
             
+            if negotiation_history.get("Status") == "completed":
+                return respond(409, "Negotiation already completed")
+            
             negotiation_response = negotiate_with_claude(
                 agent_profile, negotiation_history, incoming_message, agent_role
             )
@@ -292,6 +249,7 @@ def lambda_handler(event, context):
             
             if negotiation_response["action"] in ["accept", "reject"]:
                 negotiation_history["Status"] = "completed"
+                negotiation_history["CompletedAt"] = datetime.utcnow().isoformat()
             
             save_negotiation_state(negotiation_history)
             
@@ -306,6 +264,12 @@ def lambda_handler(event, context):
         else:
             return respond(400, f"Unknown action: {action}")
             
+    except BedrockThrottledError as e:
+        logger.warning(f"Bedrock throttled: {str(e)}")
+        return respond(429, f"Model capacity exceeded, retry later: {str(e)}")
+    except BedrockError as e:
+        logger.error(f"Bedrock error: {str(e)}")
+        return respond(502, f"Model invocation failed: {str(e)}")
     except Exception as e:
         logger.error(f"Lambda handler error: {str(e)}")
         return respond(500, f"Internal server error: {str(e)}")
@@ -5,20 +5,20 @@ import logging
 from datetime import datetime
 from botocore.exceptions import ClientError
 from decimal import Decimal
+from chimp_bedrock import set_deadline, invoke_claude, extract_json, BedrockError, BedrockThrottledError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 AGENT_TABLE_NAME = "ChimpBuddy_AgentRegistry"
+PROFILE_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
 BRIDGE_ENDPOINT = "https://xxxxxxxxxx.execute-api.us-east-1.amazonaws.com/default/ChimpBridge_RegisterAgent"
 
 dynamodb = boto3.resource("dynamodb")
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
 agent_table = dynamodb.Table(AGENT_TABLE_NAME)
 
 def extract_profile_with_ai(description):
-    try:
-        prompt = f"""Extract structured information from this agent description:
+    prompt = f"""Extract structured information from this agent description:
 
 "{description}"
 
@@ -32,30 +32,8 @@ Return ONLY a JSON object with these fields:
   "ContactInfo": "extracted contact or generate"
 }}"""
 
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-haiku-20240307-v1:0",
-            body=json.dumps({
-                "messages": [{"role": "user", "content": prompt}],
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 500,
-                "temperature": 0.3
-            }),
-            contentType="application/json",
-            accept="application/json"
-        )
-        
-        result = json.loads(response["body"].read())
-        ai_response = result["content"][0]["text"].strip()
-        
-        import re
-        json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        
-        return None
-    except Exception as e:
-        logger.error(f"AI extraction error: {str(e)}")
-        return None
+    ai_response = invoke_claude(PROFILE_MODEL_ID, prompt, max_tokens=500, temperature=0.3)
+    return extract_json(ai_response, PROFILE_MODEL_ID)
 
 def register_with_bridge(client_id, profile):
     try:
@@ -70,6 +48,7 @@ def register_with_bridge(client_id, profile):
         return False
 
 def lambda_handler(event, context):
+    set_deadline(context)
     try:
         query_params = event.get('queryStringParameters', {}) or {}
         client_id = query_params.get('ClientID')
@@ -86,8 +65,6 @@ def lambda_handler(event, context):
                 return respond(400, "Missing description")
             
             extracted_profile = extract_profile_with_ai(description)
-            if not extracted_profile:
-                return respond(500, "Failed to extract profile")
             
             agent_data = {
                 "ClientID": client_id,
@@ -119,6 +96,12 @@ def lambda_handler(event, context):
         else:
             return respond(400, f"Unknown action: {action}")
             
+    except BedrockThrottledError as e:
+        logger.warning(f"Bedrock throttled: {str(e)}")
+        return respond(429, f"Model capacity exceeded, retry later: {str(e)}")
+    except BedrockError as e:
+        logger.error(f"Bedrock error: {str(e)}")
+        return respond(502, f"Model invocation failed: {str(e)}")
     except Exception as e:
         logger.error(f"Handler error: {str(e)}")
         return respond(500, f"Internal server error: {str(e)}")
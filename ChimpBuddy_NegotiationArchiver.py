@@ -0,0 +1,204 @@
+import json
+import gzip
+import hashlib
+import uuid
+import boto3
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from decimal import Decimal
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+NEGOTIATION_TABLE_NAME = "ChimpBuddy_Negotiations"
+ARCHIVE_BUCKET = os.environ.get("ARCHIVE_BUCKET", "chimpbuddy-negotiation-archive")
+ARCHIVE_PREFIX = "negotiations/"
+MANIFEST_PREFIX = "manifest/"
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "7"))
+HOT_TTL_DAYS = int(os.environ.get("HOT_TTL_DAYS", "1"))
+TTL_ATTRIBUTE = "ExpiresAt"
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "200"))
+# Stop starting new batches once the Lambda has less than this left
+ARCHIVE_MIN_REMAINING_MS = int(os.environ.get("ARCHIVE_MIN_REMAINING_MS", "60000"))
+MANIFEST_MAX_ATTEMPTS = 5
+MANIFEST_CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+dynamodb = boto3.resource("dynamodb")
+s3 = boto3.client("s3")
+negotiation_table = dynamodb.Table(NEGOTIATION_TABLE_NAME)
+
+def archivable_batches(cutoff):
+    """Yield scan pages of completed negotiations last updated before cutoff and not yet archived."""
+    scan_kwargs = {
+        "FilterExpression": Attr("Status").eq("completed")
+            & Attr("UpdatedAt").lt(cutoff.isoformat())
+            & Attr("ArchivedAt").not_exists(),
+        "Limit": ARCHIVE_BATCH_SIZE
+    }
+    while True:
+        response = negotiation_table.scan(**scan_kwargs)
+        if response.get('Items'):
+            yield response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        scan_kwargs["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+def manifest_key(negotiation_id):
+    bucket = hashlib.sha1(negotiation_id.encode("utf-8")).hexdigest()[:2]
+    return f"{MANIFEST_PREFIX}{bucket}.json"
+
+def load_manifest(key):
+    """Return a manifest bucket and its ETag (None if it doesn't exist yet)."""
+    try:
+        response = s3.get_object(Bucket=ARCHIVE_BUCKET, Key=key)
+        return json.loads(response['Body'].read()), response['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] == "NoSuchKey":
+            return {}, None
+        raise
+
+def update_manifest(key, locations):
+    # Conditional put so overlapping archive runs can't drop each other's entries
+    for attempt in range(MANIFEST_MAX_ATTEMPTS):
+        manifest, etag = load_manifest(key)
+        manifest.update(locations)
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            s3.put_object(Bucket=ARCHIVE_BUCKET, Key=key, Body=json.dumps(manifest), **condition)
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] not in MANIFEST_CONFLICT_CODES:
+                raise
+            logger.info(f"Manifest {key} conflict on attempt {attempt + 1}, retrying")
+    raise RuntimeError(f"Manifest {key} kept changing, archive run aborted before marking items")
+
+def update_manifests(entries):
+    by_manifest = {}
+    for negotiation_id, location in entries.items():
+        by_manifest.setdefault(manifest_key(negotiation_id), {})[negotiation_id] = location
+    
+    for key, locations in by_manifest.items():
+        update_manifest(key, locations)
+
+def write_partition(date, items, batch_id):
+    key = f"{ARCHIVE_PREFIX}dt={date}/{batch_id}.jsonl.gz"
+    lines = [json.dumps(item, default=decimal_default) for item in items]
+    body = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+    s3.put_object(
+        Bucket=ARCHIVE_BUCKET,
+        Key=key,
+        Body=body,
+        ContentType="application/gzip"
+    )
+    return {item["NegotiationID"]: {"Key": key, "Line": line} for line, item in enumerate(items)}
+
+def mark_archived(item, archived_at, expires_at):
+    """Set the TTL only if the item is still the version that was archived."""
+    try:
+        negotiation_table.update_item(
+            Key={"NegotiationID": item["NegotiationID"]},
+            UpdateExpression=f"SET ArchivedAt = :archived_at, {TTL_ATTRIBUTE} = :expires_at",
+            ConditionExpression=Attr("UpdatedAt").eq(item.get("UpdatedAt")),
+            ExpressionAttributeValues={":archived_at": archived_at, ":expires_at": expires_at}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != "ConditionalCheckFailedException":
+            raise
+        logger.warning(f"Negotiation {item['NegotiationID']} changed since archiving, leaving it hot")
+        return False
+
+def archive_batch(items, now):
+    """Write one batch to S3, point the manifest at it, then start the hot copies' TTL."""
+    # Partition by the date each negotiation completed
+    partitions = {}
+    for item in items:
+        completed = item.get("CompletedAt") or item.get("UpdatedAt") or item.get("CreatedAt", "")
+        partitions.setdefault(completed[:10] or "unknown", []).append(item)
+    
+    # Unique per batch so overlapping runs never overwrite each other's objects
+    batch_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    entries = {}
+    for date, partition_items in sorted(partitions.items()):
+        entries.update(write_partition(date, partition_items, batch_id))
+    
+    # The manifest must point at the archive before the hot copies start expiring
+    update_manifests(entries)
+    
+    archived_at = now.isoformat()
+    expires_at = int(time.time()) + HOT_TTL_DAYS * 86400
+    archived = sum(mark_archived(item, archived_at, expires_at) for item in items)
+    return archived, set(partitions)
+
+def archive_negotiations(archive_after_days=ARCHIVE_AFTER_DAYS, context=None):
+    now = datetime.utcnow()
+    archived, skipped, partitions = 0, 0, set()
+    complete = True
+    
+    # Each batch is committed on its own, so a run cut short still makes progress
+    for items in archivable_batches(now - timedelta(days=archive_after_days)):
+        if context is not None and context.get_remaining_time_in_millis() < ARCHIVE_MIN_REMAINING_MS:
+            complete = False
+            break
+        batch_archived, batch_partitions = archive_batch(items, now)
+        archived += batch_archived
+        skipped += len(items) - batch_archived
+        partitions |= batch_partitions
+    
+    logger.info(f"Archived {archived} negotiations into {len(partitions)} partitions (complete: {complete})")
+    return {"archived": archived, "skipped": skipped, "partitions": sorted(partitions), "complete": complete}
+
+def get_archived_negotiation(negotiation_id):
+    location = load_manifest(manifest_key(negotiation_id))[0].get(negotiation_id)
+    if not location:
+        return None
+    
+    response = s3.get_object(Bucket=ARCHIVE_BUCKET, Key=location["Key"])
+    lines = gzip.decompress(response['Body'].read()).decode("utf-8").splitlines()
+    return json.loads(lines[location["Line"]])
+
+def lambda_handler(event, context):
+    try:
+        # Scheduled (EventBridge) invocations carry no body and run the archival stage
+        body = json.loads(event.get("body") or "{}")
+        action = body.get("action", "archive")
+        
+        if action == "archive":
+            archive_after_days = int(body.get("archive_after_days", ARCHIVE_AFTER_DAYS))
+            return respond(200, archive_negotiations(archive_after_days, context))
+        
+        elif action == "get":
+            negotiation_id = body.get("negotiation_id")
+            if not negotiation_id:
+                return respond(400, "Missing negotiation_id")
+            
+            negotiation = get_archived_negotiation(negotiation_id)
+            if not negotiation:
+                return respond(404, "Archived negotiation not found")
+            return respond(200, negotiation)
+        
+        else:
+            return respond(400, f"Unknown action: {action}")
+    
+    except Exception as e:
+        logger.error(f"Archiver error: {str(e)}")
+        return respond(500, f"Internal server error: {str(e)}")
+
+def respond(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json.dumps(body, default=decimal_default)
+    }
+
+def decimal_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
\ No newline at end of file
@@ -0,0 +1,403 @@
+"""Shared Bedrock invocation layer for the ChimpBridge/ChimpBuddy Lambdas.
+
+Every model call goes through invoke_model, which takes a token from a
+per-model bucket shared by all Lambda containers in DynamoDB and retries
+throttling with jittered exponential backoff. The bucket's refill rate adapts
+AIMD-style: it grows on success and halves on throttling. Deterministic calls
+go through invoke_model_cached, which coalesces identical requests across
+containers. Failures surface as BedrockError subclasses instead of canned
+fallback answers.
+"""
+import json
+import gzip
+import hashlib
+import os
+import random
+import re
+import time
+import logging
+from collections import OrderedDict
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.config import Config
+from botocore.exceptions import ClientError, ReadTimeoutError, EndpointConnectionError
+
+logger = logging.getLogger()
+
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION", os.environ.get("AWS_REGION", "us-east-1"))
+MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = float(os.environ.get("BEDROCK_BACKOFF_BASE", "0.25"))
+BACKOFF_CAP = float(os.environ.get("BEDROCK_BACKOFF_CAP", "8"))
+# Stay inside API Gateway's 29s integration timeout so callers get a typed error
+REQUEST_BUDGET = float(os.environ.get("BEDROCK_REQUEST_BUDGET", "25"))
+MIN_ATTEMPT_SECONDS = float(os.environ.get("BEDROCK_MIN_ATTEMPT_SECONDS", "4"))
+READ_TIMEOUT = float(os.environ.get("BEDROCK_READ_TIMEOUT", "20"))
+CONNECT_TIMEOUT = 2
+# Headroom left after an attempt's read timeout for the handler to respond
+ATTEMPT_MARGIN_SECONDS = 1
+LIMITS_TABLE_NAME = os.environ.get("BEDROCK_LIMITS_TABLE", "ChimpBridge_BedrockLimits")
+INITIAL_RATE = float(os.environ.get("BEDROCK_INITIAL_RATE", "2"))
+MIN_RATE = float(os.environ.get("BEDROCK_MIN_RATE", "0.2"))
+MAX_RATE = float(os.environ.get("BEDROCK_MAX_RATE", "20"))
+CACHE_TABLE_NAME = os.environ.get("BEDROCK_CACHE_TABLE", "ChimpBridge_BedrockCache")
+CACHE_TTL_SECONDS = int(os.environ.get("BEDROCK_CACHE_TTL_SECONDS", "86400"))
+LOCAL_CACHE_ENTRIES = 256
+# How long a leader may hold an in-flight lease, and how often followers poll for its result
+LEASE_SECONDS = 10
+LEASE_POLL_SECONDS = 0.05
+LIMITER_BACKOFF_BASE = 0.02
+LIMITER_BACKOFF_CAP = 1.0
+
+THROTTLE_ERRORS = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+LIMITER_CONTENTION_ERRORS = {
+    "ConditionalCheckFailedException", "ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"
+}
+TRANSIENT_ERRORS = {"ServiceUnavailableException", "ModelNotReadyException", "ModelTimeoutException", "InternalServerException"}
+
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+
+class BedrockError(Exception):
+    """Base class for model invocation failures."""
+
+    def __init__(self, message, model_id=None):
+        super().__init__(message)
+        self.model_id = model_id
+
+
+class BedrockThrottledError(BedrockError):
+    """The model stayed throttled after every retry."""
+
+
+class BedrockInvocationError(BedrockError):
+    """The model call failed with a non-retryable or persistent error."""
+
+
+class BedrockResponseError(BedrockError):
+    """The model answered, but not in the expected shape."""
+
+
+_clients = {}
+_limits_table = None
+_cache_table = None
+_local_cache = OrderedDict()
+_deadline = None
+
+
+def get_client(read_timeout):
+    """Bedrock client with the given whole-second read timeout.
+
+    botocore fixes timeouts per client, so one client is kept per timeout.
+    """
+    read_timeout = max(1, int(read_timeout))
+    if read_timeout not in _clients:
+        # Retries are handled here so throttling also feeds the shared rate limit
+        _clients[read_timeout] = boto3.client(
+            "bedrock-runtime",
+            region_name=BEDROCK_REGION,
+            config=Config(
+                retries={"max_attempts": 1, "mode": "standard"},
+                connect_timeout=CONNECT_TIMEOUT,
+                read_timeout=read_timeout
+            )
+        )
+    return _clients[read_timeout]
+
+
+def get_limits_table():
+    global _limits_table
+    if _limits_table is None:
+        _limits_table = boto3.resource("dynamodb").Table(LIMITS_TABLE_NAME)
+    return _limits_table
+
+
+def get_cache_table():
+    global _cache_table
+    if _cache_table is None:
+        _cache_table = boto3.resource("dynamodb").Table(CACHE_TABLE_NAME)
+    return _cache_table
+
+
+def set_deadline(context=None):
+    """Start the time budget for one Lambda request; call at the top of each handler.
+
+    All model calls made while handling the request share the budget, capped by
+    the Lambda's own remaining time when a context is given.
+    """
+    global _deadline
+    budget = REQUEST_BUDGET
+    if context is not None:
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - 1)
+    _deadline = time.monotonic() + budget
+
+
+def time_left():
+    if _deadline is None:
+        set_deadline()
+    return _deadline - time.monotonic()
+
+
+def to_decimal(value):
+    return Decimal(str(round(value, 6)))
+
+
+def limiter_wait(model_id, delay):
+    if delay + MIN_ATTEMPT_SECONDS > time_left():
+        raise BedrockThrottledError(f"{model_id} rate limit leaves no time for a call within the request budget", model_id)
+    time.sleep(delay)
+
+
+def acquire_token(model_id):
+    """Take one token from the model's shared bucket, waiting for a refill if it's empty.
+
+    Returns the rate the token was taken at, or None if the limiter table is
+    unavailable (e.g. missing), in which case the call proceeds unlimited.
+    Losing the token race or DynamoDB throttling on the bucket item means the
+    bucket is contended, so the caller backs off instead.
+    """
+    table = get_limits_table()
+    contention = 0
+    while True:
+        try:
+            item = table.get_item(Key={"ModelID": model_id}, ConsistentRead=True).get("Item")
+            now = time.time()
+            rate = float(item["Rate"]) if item else INITIAL_RATE
+            burst = max(1.0, rate)
+            tokens = float(item["Tokens"]) if item else burst
+            if item:
+                tokens = min(burst, tokens + (now - float(item["UpdatedAt"])) * rate)
+
+            if tokens >= 1:
+                condition = Attr("UpdatedAt").eq(item["UpdatedAt"]) if item else Attr("ModelID").not_exists()
+                table.update_item(
+                    Key={"ModelID": model_id},
+                    UpdateExpression="SET Tokens = :tokens, UpdatedAt = :now, Rate = if_not_exists(Rate, :rate)",
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues={
+                        ":tokens": to_decimal(tokens - 1),
+                        ":now": to_decimal(now),
+                        ":rate": to_decimal(rate)
+                    }
+                )
+                return rate
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in LIMITER_CONTENTION_ERRORS:
+                logger.warning(f"Bedrock rate limiter unavailable, proceeding unthrottled: {str(e)}")
+                return None
+            contention += 1
+            limiter_wait(model_id, random.uniform(0, min(LIMITER_BACKOFF_CAP, LIMITER_BACKOFF_BASE * (2 ** contention))))
+            continue
+
+        # Jitter the wait so containers sharing an empty bucket don't wake together
+        limiter_wait(model_id, (1 - tokens) / rate * random.uniform(1, 1.5))
+
+
+def record_outcome(model_id, seen_rate, throttled):
+    """AIMD: halve the shared rate on throttling, add ~1 req/s per second of successes."""
+    if seen_rate is None:
+        return
+    if throttled:
+        new_rate = max(MIN_RATE, seen_rate / 2)
+    else:
+        new_rate = min(MAX_RATE, seen_rate + 1.0 / seen_rate)
+    if new_rate == seen_rate:
+        return
+
+    try:
+        # Only the first caller to see a given rate adjusts it, so a burst of
+        # throttles halves the rate once rather than once per container
+        get_limits_table().update_item(
+            Key={"ModelID": model_id},
+            UpdateExpression="SET Rate = :new_rate",
+            ConditionExpression=Attr("Rate").eq(to_decimal(seen_rate)),
+            ExpressionAttributeValues={":new_rate": to_decimal(new_rate)}
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.warning(f"Could not update Bedrock rate for {model_id}: {str(e)}")
+
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLE_ERRORS
+
+
+def budget_exhausted(model_id, attempts, last_error):
+    # Only report throttling (429) when throttling is what used up the budget
+    message = f"{model_id} request budget exhausted after {attempts} attempts"
+    if is_throttle(last_error):
+        return BedrockThrottledError(message, model_id)
+    return BedrockInvocationError(f"{message}: {str(last_error)}" if last_error else message, model_id)
+
+
+def backoff_delay(attempt):
+    # Full jitter keeps retrying callers from synchronizing into error storms
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def invoke_model(model_id, payload):
+    """Invoke a model and return its decoded JSON response."""
+    body = json.dumps(payload)
+    last_error = None
+
+    for attempt in range(MAX_ATTEMPTS):
+        if time_left() < MIN_ATTEMPT_SECONDS:
+            raise budget_exhausted(model_id, attempt, last_error) from last_error
+        rate = acquire_token(model_id)
+        # Bound the attempt by what is left of the budget, not just READ_TIMEOUT
+        read_timeout = min(READ_TIMEOUT, time_left() - CONNECT_TIMEOUT - ATTEMPT_MARGIN_SECONDS)
+        if read_timeout < 1:
+            raise budget_exhausted(model_id, attempt, last_error) from last_error
+        try:
+            response = get_client(read_timeout).invoke_model(
+                modelId=model_id,
+                body=body,
+                contentType="application/json",
+                accept="application/json"
+            )
+            result = json.loads(response["body"].read())
+            record_outcome(model_id, rate, throttled=False)
+            return result
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code not in THROTTLE_ERRORS and code not in TRANSIENT_ERRORS:
+                raise BedrockInvocationError(f"{model_id} failed: {code}: {str(e)}", model_id) from e
+            if code in THROTTLE_ERRORS:
+                record_outcome(model_id, rate, throttled=True)
+            last_error = e
+        except (ReadTimeoutError, EndpointConnectionError) as e:
+            last_error = e
+        except ValueError as e:
+            raise BedrockResponseError(f"{model_id} returned invalid JSON: {str(e)}", model_id) from e
+
+        if attempt == MAX_ATTEMPTS - 1:
+            break
+        delay = backoff_delay(attempt)
+        if delay + MIN_ATTEMPT_SECONDS > time_left():
+            raise budget_exhausted(model_id, attempt + 1, last_error) from last_error
+        logger.warning(f"Bedrock {model_id} attempt {attempt + 1} failed ({str(last_error)}), retrying in {delay:.2f}s")
+        time.sleep(delay)
+
+    if is_throttle(last_error):
+        raise BedrockThrottledError(f"{model_id} throttled after {MAX_ATTEMPTS} attempts", model_id) from last_error
+    raise BedrockInvocationError(f"{model_id} failed after {MAX_ATTEMPTS} attempts: {str(last_error)}", model_id) from last_error
+
+
+def remember(request_hash, result):
+    _local_cache[request_hash] = result
+    _local_cache.move_to_end(request_hash)
+    while len(_local_cache) > LOCAL_CACHE_ENTRIES:
+        _local_cache.popitem(last=False)
+
+
+def read_cached(table, request_hash):
+    item = table.get_item(Key={"RequestHash": request_hash}, ConsistentRead=True).get("Item")
+    if item and "Response" in item:
+        return json.loads(gzip.decompress(item["Response"].value)), item
+    return None, item
+
+
+def claim_lease(table, request_hash):
+    now = time.time()
+    try:
+        table.put_item(
+            Item={
+                "RequestHash": request_hash,
+                "LeaseUntil": to_decimal(now + LEASE_SECONDS),
+                "ExpiresAt": int(now) + CACHE_TTL_SECONDS
+            },
+            ConditionExpression=Attr("RequestHash").not_exists()
+                | (Attr("Response").not_exists() & Attr("LeaseUntil").lt(to_decimal(now)))
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def await_leader(table, request_hash):
+    """Poll for another container's in-flight result until its lease lapses or the budget runs low."""
+    while time_left() > MIN_ATTEMPT_SECONDS:
+        result, item = read_cached(table, request_hash)
+        if result is not None:
+            return result
+        if not item or float(item.get("LeaseUntil", 0)) < time.time():
+            return None
+        time.sleep(LEASE_POLL_SECONDS * random.uniform(1, 2))
+    return None
+
+
+def invoke_model_cached(model_id, payload):
+    """invoke_model for deterministic models (e.g. embeddings), shared across containers.
+
+    Results are cached in-process and in the BEDROCK_CACHE_TABLE DynamoDB table
+    by request hash. Concurrent identical requests are coalesced: the first
+    caller takes a lease and makes the call, the rest wait for its result. If
+    the cache table is unavailable the call is made directly.
+    """
+    body = json.dumps(payload, sort_keys=True)
+    request_hash = hashlib.sha256(f"{model_id}\n{body}".encode("utf-8")).hexdigest()
+    if request_hash in _local_cache:
+        _local_cache.move_to_end(request_hash)
+        return _local_cache[request_hash]
+
+    table = get_cache_table()
+    leader = False
+    try:
+        result, _ = read_cached(table, request_hash)
+        if result is None:
+            leader = claim_lease(table, request_hash)
+            if not leader:
+                result = await_leader(table, request_hash)
+    except ClientError as e:
+        logger.warning(f"Bedrock response cache unavailable, invoking directly: {str(e)}")
+        result = None
+
+    if result is None:
+        try:
+            result = invoke_model(model_id, payload)
+        except BedrockError:
+            if leader:
+                # Release the lease so waiting containers stop waiting and try themselves
+                try:
+                    table.delete_item(Key={"RequestHash": request_hash}, ConditionExpression=Attr("Response").not_exists())
+                except ClientError:
+                    pass
+            raise
+        try:
+            table.put_item(Item={
+                "RequestHash": request_hash,
+                "Response": gzip.compress(json.dumps(result).encode("utf-8")),
+                "ExpiresAt": int(time.time()) + CACHE_TTL_SECONDS
+            })
+        except ClientError as e:
+            logger.warning(f"Could not cache Bedrock response for {model_id}: {str(e)}")
+
+    remember(request_hash, result)
+    return result
+
+
+def invoke_claude(model_id, prompt, max_tokens, temperature):
+    """Send a single-turn prompt to a Claude model and return the reply text."""
+    result = invoke_model(model_id, {
+        "messages": [{"role": "user", "content": prompt}],
+        "anthropic_version": ANTHROPIC_VERSION,
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    })
+    try:
+        return result["content"][0]["text"].strip()
+    except (KeyError, IndexError, TypeError) as e:
+        raise BedrockResponseError(f"{model_id} returned no text content", model_id) from e
+
+
+def extract_json(text, model_id=None):
+    """Pull the JSON object out of a model reply."""
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not json_match:
+        raise BedrockResponseError(f"No JSON object in model response: {text}", model_id)
+    try:
+        return json.loads(json_match.group())
+    except ValueError as e:
+        raise BedrockResponseError(f"Malformed JSON in model response: {str(e)}", model_id) from e